@@ -2,6 +2,7 @@
 
 import os
 import json
+import orjson
 import streamlit as st
 from pathlib import Path
 from dotenv import load_dotenv
@@ -19,6 +20,16 @@ SUMMARY_CLUSTER = Path("summaries/summarized_candidates_cluster.json")
 st.set_page_config(page_title="Newsletter Section Matches", layout="wide")
 st.title("📚 Newsletter Section Review Tool")
 
+# Cache disk access so checkbox/radio reruns don't rescan directories or
+# reparse files on every interaction
+@st.cache_data(ttl=60)
+def list_section_files(match_dir: str) -> list[Path]:
+    return sorted(Path(match_dir).glob("*.json"))
+
+@st.cache_data(ttl=60)
+def load_json(path: str):
+    return orjson.loads(Path(path).read_bytes())
+
 # Tabbed interface
 tab1, tab2 = st.tabs(["🧠 Section Matches", "📝 Summarized Candidates"])
 
@@ -29,7 +40,7 @@ with tab1:
     MODE_DIR = "single" if mode == "Single Centroid" else "clustered"
 
     # Gather available match files
-    section_files = sorted(Path(MATCH_DIR).glob("*.json"))
+    section_files = list_section_files(MATCH_DIR)
     if not section_files:
         st.warning(f"No match files found in `{MATCH_DIR}`")
         st.stop()
@@ -38,8 +49,7 @@ with tab1:
     section = st.selectbox("🗂️ Select Section", [f.stem.upper() for f in section_files])
     file_path = next(f for f in section_files if f.stem.upper() == section)
 
-    with open(file_path) as f:
-        matches = json.load(f)
+    matches = load_json(str(file_path))
 
     st.subheader(f"Top {len(matches)} {mode.lower()} matches for: `{section}`")
 
@@ -79,8 +89,7 @@ with tab2:
         st.info(f"No summaries found yet for `{summary_mode}` mode. Run summarization first.")
     else:
         try:
-            with open(summary_path) as f:
-                summaries = json.load(f)
+            summaries = load_json(str(summary_path))
 
             for entry in summaries:
                 st.markdown("---")
@@ -8,8 +8,7 @@ import os
 import duckdb
 import dotenv
 import numpy as np
-from collections import defaultdict
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from tqdm import tqdm
 
 # Load config from .env
@@ -31,38 +30,44 @@ con.execute(f"""
 CREATE TABLE {CLUSTER_TABLE} (
     section TEXT,
     cluster_id INTEGER,
-    embedding DOUBLE[{EMBEDDING_DIM}]
+    embedding FLOAT[{EMBEDDING_DIM}]
 )
 """)
 
-# Collect and group historical embeddings by section
-rows = con.execute(f"SELECT section, embedding FROM {LINK_TABLE} WHERE section != 'CANDIDATE'").fetchall()
-section_vectors = defaultdict(list)
-
-for section, emb in rows:
-    if emb is not None:
-        section_vectors[section.upper()].append(np.array(emb))
+# Collect historical embeddings in one vectorized scan and group in pandas
+# instead of building per-row ndarrays in a Python loop
+df = con.execute(f"""
+    SELECT upper(section) AS section, embedding
+    FROM {LINK_TABLE}
+    WHERE upper(section) != 'CANDIDATE' AND embedding IS NOT NULL
+""").fetch_df()
 
 # Cluster and insert
 print(f"📡 Generating clustered fingerprints with k={NUM_CLUSTERS} into table `{CLUSTER_TABLE}`")
 
-for section, vectors in tqdm(section_vectors.items(), desc="🔁 Clustering sections"):
-    matrix = np.stack(vectors)
+insert_rows = []
+for section, group in tqdm(df.groupby("section"), desc="🔁 Clustering sections"):
+    matrix = np.vstack(group["embedding"].to_numpy()).astype(np.float32)
     if len(matrix) < NUM_CLUSTERS:
         # fallback to mean if not enough samples
         centroid = matrix.mean(axis=0)
-        con.execute(f"""
-        INSERT INTO {CLUSTER_TABLE} (section, cluster_id, embedding)
-        VALUES (?, ?, ?)
-        """, [section, 0, centroid.tolist()])
+        centroid /= np.linalg.norm(centroid) + 1e-12
+        insert_rows.append((section, 0, centroid.tolist()))
     else:
-        km = KMeans(n_clusters=NUM_CLUSTERS, random_state=42, n_init="auto")
+        # MiniBatchKMeans converges far faster than full Lloyd iterations on
+        # high-dimensional embeddings with equivalent centroid quality
+        km = MiniBatchKMeans(n_clusters=NUM_CLUSTERS, batch_size=4096, n_init=3, random_state=42)
         km.fit(matrix)
         for i, center in enumerate(km.cluster_centers_):
-            con.execute(f"""
-            INSERT INTO {CLUSTER_TABLE} (section, cluster_id, embedding)
-            VALUES (?, ?, ?)
-            """, [section, i, center.tolist()])
+            # Store unit-norm so cosine against a normalized candidate is a plain dot product
+            center = center / (np.linalg.norm(center) + 1e-12)
+            insert_rows.append((section, i, center.tolist()))
 
-print(f"✅ Clustered fingerprints inserted into `{CLUSTER_TABLE}`")
+# executemany rejects an empty parameter list; nothing to insert is fine
+if insert_rows:
+    con.executemany(f"""
+    INSERT INTO {CLUSTER_TABLE} (section, cluster_id, embedding)
+    VALUES (?, ?, ?)
+    """, insert_rows)
 
+print(f"✅ Inserted {len(insert_rows)} clustered fingerprints into `{CLUSTER_TABLE}`")
@@ -3,7 +3,6 @@ import duckdb
 import dotenv
 import numpy as np
 from tqdm import tqdm
-from collections import defaultdict
 
 dotenv.load_dotenv()
 
@@ -21,19 +20,26 @@ CREATE TABLE {FINGERPRINT_TABLE} (
 )
 """)
 
-rows = con.execute(f"SELECT section, embedding FROM {LINK_TABLE}").fetchall()
-section_vectors = defaultdict(list)
-for section, emb in rows:
-    if emb is not None:
-        section_upper = section.upper()
-        if section_upper != "CANDIDATE":
-            section_vectors[section_upper].append(np.array(emb))
+# Pull all historical embeddings in one vectorized scan and group in pandas
+# instead of building per-row ndarrays in a Python loop
+df = con.execute(f"""
+    SELECT upper(section) AS section, embedding
+    FROM {LINK_TABLE}
+    WHERE upper(section) != 'CANDIDATE' AND embedding IS NOT NULL
+""").fetch_df()
 
-for section, vectors in tqdm(section_vectors.items(), desc="🧠 Fingerprinting sections"):
-    matrix = np.stack(vectors)
-    fingerprint = matrix.mean(axis=0).tolist()
-    con.execute(f"""
+insert_rows = []
+for section, group in tqdm(df.groupby("section"), desc="🧠 Fingerprinting sections"):
+    matrix = np.vstack(group["embedding"].to_numpy()).astype(np.float32)
+    fingerprint = matrix.mean(axis=0)
+    # Store unit-norm so cosine against a normalized candidate is a plain dot product
+    fingerprint /= np.linalg.norm(fingerprint) + 1e-12
+    insert_rows.append((section, fingerprint.tolist()))
+
+# executemany rejects an empty parameter list; nothing to insert is fine
+if insert_rows:
+    con.executemany(f"""
     INSERT INTO {FINGERPRINT_TABLE} (section, embedding)
     VALUES (?, ?)
-    """, [section, fingerprint])
-print(f"✅ Inserted {len(section_vectors)} section fingerprints into {FINGERPRINT_TABLE}")
+    """, insert_rows)
+print(f"✅ Inserted {len(insert_rows)} section fingerprints into {FINGERPRINT_TABLE}")
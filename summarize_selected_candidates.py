@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 
 import os
-import json
+import sys
+import time
+import random
+import asyncio
+import hashlib
+import itertools
 import duckdb
+import orjson
+from collections import defaultdict
 from pathlib import Path
-from tqdm import tqdm
 from dotenv import load_dotenv
-from google.api_core.exceptions import PermissionDenied, NotFound, ServiceUnavailable
+from aiolimiter import AsyncLimiter
+from tqdm.asyncio import tqdm_asyncio
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    NotFound,
+    PermissionDenied,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 
 # Load environment variables
 load_dotenv()
@@ -18,10 +33,19 @@ PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
 CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Optional comma-separated key pool; aggregate RPM scales with key count
+GOOGLE_API_KEYS = [k.strip() for k in os.getenv("GOOGLE_API_KEYS", "").split(",") if k.strip()]
 SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gemini-2.0-flash")
 CHAR_LIMIT = int(os.getenv("SUMMARY_CHAR_LIMIT", "280"))
+PROMPT_CHAR_BUDGET = int(os.getenv("PROMPT_CHAR_BUDGET", "8000"))
+CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "10"))
+BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
 
 DUCKDB_PATH = os.getenv("DUCKDB_PATH", "data/newsletter_embeddings.duckdb")
+CACHE_DB_PATH = os.getenv("SUMMARY_CACHE_DB", "data/summaries_cache.duckdb")
 SINGLE_DIR = Path(os.getenv("SELECTED_IDS_SINGLE_DIR", "selected_ids/single"))
 CLUSTERED_DIR = Path(os.getenv("SELECTED_IDS_CLUSTERED_DIR", "selected_ids/clustered"))
 
@@ -38,25 +62,153 @@ if USE_VERTEX:
     llm_model = genai.GenerativeModel(model_name=SUMMARY_MODEL)
     print(f"LLM initialized via Vertex AI: {SUMMARY_MODEL} @ {PROJECT_ID}/{LOCATION}")
 else:
-    if not GOOGLE_API_KEY:
-        raise ValueError("Public mode requires GOOGLE_API_KEY to be set.")
-    genai.configure(api_key=GOOGLE_API_KEY)
+    if not GOOGLE_API_KEY and not GOOGLE_API_KEYS:
+        raise ValueError("Public mode requires GOOGLE_API_KEY (or GOOGLE_API_KEYS) to be set.")
+    genai.configure(api_key=GOOGLE_API_KEYS[0] if GOOGLE_API_KEYS else GOOGLE_API_KEY)
     llm_model = genai.GenerativeModel(model_name=SUMMARY_MODEL)
     print(f"LLM initialized via Public API: {SUMMARY_MODEL}")
 
-def fetch_candidate_content(article_id):
-    con = duckdb.connect(DUCKDB_PATH)
-    try:
-        row = con.execute("SELECT id, url, content FROM link_embeddings WHERE id = ?", [article_id]).fetchone()
-    finally:
-        con.close()
-    return row if row else None
+def _model_for_key(key):
+    """Build a GenerativeModel whose async client is bound to `key`.
+
+    GenerativeModel lazily caches whichever default client exists at its
+    first generate call, so rotating keys via genai.configure alone would
+    leave every model on the first key used. Binding the client eagerly,
+    while `key` is the configured default, pins each model to its own key.
+    """
+    genai.configure(api_key=key)
+    model = genai.GenerativeModel(model_name=SUMMARY_MODEL)
+    model._async_client = genai_client.get_default_generative_async_client()
+    return model
+
+class GeminiKeyPool:
+    """Round-robin over per-key models; an exhausted key cools down for 60s."""
+
+    def __init__(self, keys, cooldown_s=60):
+        self._models = {key: _model_for_key(key) for key in keys}
+        self._cycle = itertools.cycle(keys)
+        self._size = len(keys)
+        self._disabled_until = {k: 0.0 for k in keys}
+        self._cooldown_s = cooldown_s
+
+    def acquire(self):
+        """Return the next available (key, model) pair."""
+        for _ in range(self._size):
+            key = next(self._cycle)
+            if time.monotonic() >= self._disabled_until[key]:
+                return key, self._models[key]
+        # Every key is cooling down; take the next one rather than stalling
+        key = next(self._cycle)
+        return key, self._models[key]
+
+    def cool_down(self, key):
+        self._disabled_until[key] = time.monotonic() + self._cooldown_s
+        print(f"🧊 API key …{key[-4:]} exhausted; cooling down for {self._cooldown_s}s")
+
+# Only meaningful for the public API: Vertex authenticates via service account
+key_pool = GeminiKeyPool(GOOGLE_API_KEYS) if not USE_VERTEX and len(GOOGLE_API_KEYS) > 1 else None
+
+# Single long-lived read-only connection; opening DuckDB per lookup costs more
+# than the lookup itself
+con = duckdb.connect(DUCKDB_PATH, read_only=True)
+
+def fetch_selected_rows(directory: Path):
+    """Join a directory of selected-id files against link_embeddings in one query.
 
-def generate_summary(text):
-    global llm_model
-    prompt = f"Summarize this in {CHAR_LIMIT} characters or less:\n{text}"
+    Each selected_ids file is a bare JSON array of article ids; read_json_auto
+    exposes one id per row (column `json`) plus the source filename, so the
+    glob → json.load → per-file lookup loop collapses into a single scan that
+    yields (section, id, url, content) rows in file order.
+    """
+    # Cursors execute independently, so to_thread callers don't contend on
+    # the shared connection's state
+    return con.cursor().execute("""
+        SELECT upper(regexp_extract(parse_filename(s.filename, true), '^[^.]+')) AS section,
+               le.id, le.url, le.content
+        FROM read_json_auto(?, filename=true) AS s
+        JOIN link_embeddings le ON le.id = s.json
+    """, [str(directory / "*.json")]).fetchall()
+
+# Persistent response cache in a sidecar DuckDB file (the main database stays
+# read-only). Keyed by model + content, so re-runs and the single/clustered
+# overlap become cache hits instead of repeated LLM spend.
+Path(CACHE_DB_PATH).parent.mkdir(parents=True, exist_ok=True)
+cache_con = duckdb.connect(CACHE_DB_PATH)
+cache_con.execute("CREATE TABLE IF NOT EXISTS summaries_cache (key TEXT PRIMARY KEY, summary TEXT)")
+
+def cache_key(text):
+    return hashlib.sha256(f"{SUMMARY_MODEL}\0{text or ''}".encode()).hexdigest()
+
+def cache_lookup(keys):
+    """Return key → summary for whichever keys are already cached."""
+    rows = cache_con.cursor().execute(
+        "SELECT key, summary FROM summaries_cache WHERE key = ANY(?)",
+        [list(set(keys))]
+    ).fetchall()
+    return dict(rows)
+
+def cache_store(entries):
+    if entries:
+        cache_con.cursor().executemany(
+            "INSERT OR REPLACE INTO summaries_cache VALUES (?, ?)", entries)
+
+# Built once; only the article content changes per call
+PROMPT_PREFIX = f"Summarize this in {CHAR_LIMIT} characters or less:\n"
+
+# ~3 chars per token leaves headroom over CHAR_LIMIT while stopping runaway
+# generations server-side instead of trimming them after paying for the tokens
+MAX_OUTPUT_TOKENS = max(64, CHAR_LIMIT // 3)
+
+# Client-side token buckets so we pace requests instead of burning quota on 429s
+rpm_limiter = AsyncLimiter(GEMINI_RPM, 60)
+tpm_limiter = AsyncLimiter(GEMINI_TPM, 60)
+
+# Caps Gemini requests in flight globally: the SINGLE and CLUSTERED passes each
+# run their own worker pool, so the cap has to sit above both
+request_sem = asyncio.Semaphore(CONCURRENCY)
+
+async def call_model(prompt, n_outputs=1, model=llm_model):
+    """Issue one paced Gemini request, charging the RPM and TPM buckets.
+
+    Transient throttling/outage errors are retried with capped exponential
+    backoff plus jitter; anything still failing after the last attempt is
+    re-raised for the caller to record. `n_outputs` scales the output-token
+    cap for batched prompts that return one summary per article.
+    """
+    generation_config = {
+        "max_output_tokens": MAX_OUTPUT_TOKENS * n_outputs,
+        "temperature": 0.2,
+    }
+    for attempt in range(GEMINI_MAX_RETRIES):
+        if key_pool is not None:
+            key, model = key_pool.acquire()
+        else:
+            key = None
+        try:
+            async with rpm_limiter:
+                response = await model.generate_content_async(
+                    prompt, generation_config=generation_config)
+            break
+        except (ResourceExhausted, ServiceUnavailable, DeadlineExceeded) as e:
+            if key is not None and isinstance(e, ResourceExhausted):
+                key_pool.cool_down(key)
+            if attempt == GEMINI_MAX_RETRIES - 1:
+                raise
+            # Honor a server-provided Retry-After if the exception carries one
+            delay = getattr(e, "retry_after", None) or min(60, 2 ** attempt) + random.random()
+            print(f"🔁 {type(e).__name__}; retrying in {delay:.1f}s (attempt {attempt + 1}/{GEMINI_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        await tpm_limiter.acquire(min(usage.total_token_count, GEMINI_TPM))
+    return response
+
+async def generate_summary(text):
+    # The tail of a long article rarely changes a 280-char summary, but it
+    # does inflate token spend and latency
+    prompt = PROMPT_PREFIX + (text or "")[:PROMPT_CHAR_BUDGET]
     try:
-        response = llm_model.generate_content(prompt)
+        response = await call_model(prompt)
         return response.text.strip()
     except (PermissionDenied, NotFound, ServiceUnavailable) as e:
         print(f"[API ERROR: {type(e).__name__}] {e.message}")
@@ -65,45 +217,189 @@ def generate_summary(text):
         print(f"[ERROR: Unexpected failure] {e}")
         return f"[ERROR: Unexpected failure: {e}]"
 
-def summarize_batch(directory: Path, mode: str) -> list[dict]:
-    summaries = []
-    for path in sorted(directory.glob("*.json")):
-        section = path.stem.upper()
+BATCH_PROMPT_PREFIX = (
+    f"Return only a JSON array of strings: one summary of at most {CHAR_LIMIT} "
+    "characters per numbered article, in order.\n"
+)
+
+async def generate_summary_batch(texts):
+    """Cache-aware batch summarization: only cache misses reach the model."""
+    keys = [cache_key(t) for t in texts]
+    cached = cache_lookup(keys)
+    results = [cached.get(k) for k in keys]
+    missing = [i for i, k in enumerate(keys) if k not in cached]
+    if missing:
+        fresh = await _generate_summary_batch_uncached([texts[i] for i in missing])
+        new_entries = []
+        for i, summary in zip(missing, fresh):
+            results[i] = summary
+            if not summary.startswith("[ERROR"):
+                new_entries.append((keys[i], summary))
+        cache_store(new_entries)
+    return results
+
+async def _generate_summary_batch_uncached(texts):
+    """Summarize several articles with one Gemini call, amortizing HTTPS overhead.
+
+    Falls back to per-article calls if the batched response can't be parsed.
+    """
+    if len(texts) == 1:
+        return [await generate_summary(texts[0])]
+    prompt = BATCH_PROMPT_PREFIX + "\n".join(f"[{i + 1}] {(t or '')[:PROMPT_CHAR_BUDGET]}" for i, t in enumerate(texts))
+    try:
+        response = await call_model(prompt, n_outputs=len(texts))
+        raw = response.text
+        start, end = raw.find("["), raw.rfind("]")
+        if start != -1 and end > start:
+            summaries = orjson.loads(raw[start:end + 1])
+            if isinstance(summaries, list) and len(summaries) == len(texts):
+                return [str(s).strip() for s in summaries]
+        print("⚠️ Batched response didn't match article count; retrying individually")
+    except Exception as e:
+        print(f"⚠️ Batched summary failed ({e}); retrying individually")
+    return [await generate_summary(t) for t in texts]
+
+def load_checkpoint(ckpt_path: Path) -> list[dict]:
+    """Read completed summary records from an interrupted run, if any."""
+    records = []
+    if ckpt_path.exists():
+        with open(ckpt_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    continue  # torn final line from a crash mid-write
+    return records
+
+async def _llm_worker(fetch_q, write_q, occurrences, mode):
+    """Pull article batches off fetch_q, call Gemini, hand records to the writer.
+
+    Each article is summarized once; its record is fanned out to every
+    section it was selected for. The shared semaphore caps requests in
+    flight across every pass's worker pool.
+    """
+    while True:
+        batch = await fetch_q.get()
         try:
-            with open(path) as f:
-                ids = json.load(f)
+            async with request_sem:
+                result = await generate_summary_batch([content for _, _, content in batch])
         except Exception as e:
-            print(f"⚠️ Error reading {path}: {e}")
-            continue
-
-        for aid in tqdm(ids, desc=f"{mode.upper()} → {section}", unit="article"):
-            row = fetch_candidate_content(aid)
-            if not row:
-                continue
-            article_id, url, content = row
-            summary = generate_summary(content)
-            summaries.append({
+            result = [f"[ERROR: {e}]"] * len(batch)
+        await write_q.put([
+            {
                 "id": article_id,
                 "url": url,
                 "section": section,
                 "mode": mode,
                 "summary": summary
-            })
+            }
+            for (article_id, url, _), summary in zip(batch, result)
+            for section in occurrences[article_id]
+        ])
+        fetch_q.task_done()
+
+async def _jsonl_writer(write_q, ckpt_f, summaries, bar):
+    """Single consumer draining finished records to the JSONL checkpoint.
+
+    Keeping file I/O on one task means LLM workers never block on disk and
+    checkpoint lines never interleave.
+    """
+    while True:
+        records = await write_q.get()
+        for rec in records:
+            ckpt_f.write(orjson.dumps(rec).decode() + "\n")
+        ckpt_f.flush()
+        summaries.extend(records)
+        bar.update(1)
+        write_q.task_done()
+
+async def summarize_batch(directory: Path, mode: str, ckpt_path: Path) -> list[dict]:
+    # Error records don't count as done: a resumed run retries them instead of
+    # carrying a transient failure into the final output
+    summaries = [
+        rec for rec in load_checkpoint(ckpt_path)
+        if not str(rec.get("summary", "")).startswith("[ERROR")
+    ]
+    done = {(rec["id"], rec["section"]) for rec in summaries}
+    if summaries:
+        print(f"⏩ Resuming {mode.upper()}: {len(summaries)} summaries already checkpointed")
+
+    # DuckDB is blocking; keep it off the event loop
+    try:
+        selected = await asyncio.to_thread(fetch_selected_rows, directory)
+    except duckdb.Error as e:
+        print(f"⚠️ Error reading {directory}: {e}")
+        return summaries
+
+    # An id selected for several sections is summarized once; its sections are
+    # remembered so the single summary fans out to every occurrence
+    occurrences = defaultdict(list)
+    unique_rows = {}
+    for section, aid, url, content in selected:
+        if (aid, section) not in done:
+            occurrences[aid].append(section)
+            unique_rows[aid] = (url, content)
+
+    rows = [(aid, url, content) for aid, (url, content) in unique_rows.items()]
+    slots = sum(len(v) for v in occurrences.values())
+
+    # Batch articles per request — each batch is one network-bound Gemini call
+    batches = [rows[i:i + BATCH_SIZE] for i in range(0, len(rows), BATCH_SIZE)]
+    print(f"🛰️ {mode.upper()}: {len(rows)} unique articles ({slots} section slots) in {len(batches)} batches")
+
+    # Three-stage pipeline over bounded queues: feed batches → CONCURRENCY LLM
+    # workers → one JSONL writer. DB, network and disk overlap, and the queue
+    # bounds cap how much work sits in flight at once.
+    fetch_q = asyncio.Queue(maxsize=256)
+    write_q = asyncio.Queue(maxsize=256)
+    # Progress advances as batches are written out, not as they are submitted;
+    # throttled refreshes and auto-disable off-TTY keep the bar cheap
+    with open(ckpt_path, "a") as ckpt_f, tqdm_asyncio(
+        total=len(batches), desc=f"🛰️ {mode.upper()}", unit="batch",
+        mininterval=0.5, miniters=max(1, len(batches) // 200),
+        disable=not sys.stderr.isatty()
+    ) as bar:
+        workers = [
+            asyncio.create_task(_llm_worker(fetch_q, write_q, occurrences, mode))
+            for _ in range(CONCURRENCY)
+        ]
+        writer = asyncio.create_task(_jsonl_writer(write_q, ckpt_f, summaries, bar))
+        for batch in batches:
+            await fetch_q.put(batch)
+        await fetch_q.join()
+        await write_q.join()
+        for task in workers + [writer]:
+            task.cancel()
     return summaries
 
-def main():
-    print("🔁 Summarizing SINGLE selections...")
-    single = summarize_batch(SINGLE_DIR, mode="single")
-    with open(OUT_SINGLE, "w") as f:
-        json.dump(single, f, indent=2)
-    print(f"✅ Saved {len(single)} summaries to {OUT_SINGLE}")
+async def main():
+    try:
+        print("🔁 Summarizing SINGLE and CLUSTERED selections...")
+        # Both passes share the global request semaphore, rate limiters and
+        # cache, so running them together keeps the pipeline full across the
+        # tail of either pass without exceeding the concurrency cap
+        single, cluster = await asyncio.gather(
+            summarize_batch(SINGLE_DIR, mode="single", ckpt_path=OUT_SINGLE.with_suffix(".jsonl")),
+            summarize_batch(CLUSTERED_DIR, mode="clustered", ckpt_path=OUT_CLUSTER.with_suffix(".jsonl")),
+        )
+        with open(OUT_SINGLE, "wb") as f:
+            f.write(orjson.dumps(single, option=orjson.OPT_INDENT_2))
+        print(f"✅ Saved {len(single)} summaries to {OUT_SINGLE}")
+        # The checkpoint only spans one run; clearing it keeps next week's
+        # selections from inheriting stale records or skips
+        OUT_SINGLE.with_suffix(".jsonl").unlink(missing_ok=True)
 
-    print("🔁 Summarizing CLUSTERED selections...")
-    cluster = summarize_batch(CLUSTERED_DIR, mode="clustered")
-    with open(OUT_CLUSTER, "w") as f:
-        json.dump(cluster, f, indent=2)
-    print(f"✅ Saved {len(cluster)} summaries to {OUT_CLUSTER}")
+        with open(OUT_CLUSTER, "wb") as f:
+            f.write(orjson.dumps(cluster, option=orjson.OPT_INDENT_2))
+        print(f"✅ Saved {len(cluster)} summaries to {OUT_CLUSTER}")
+        OUT_CLUSTER.with_suffix(".jsonl").unlink(missing_ok=True)
+    finally:
+        con.close()
+        cache_con.close()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 